@@ -6,53 +6,406 @@ Supports .m4a files with sequence naming (e.g., xx_1.m4a, xx_2.m4a)
 
 import os
 import re
+import sys
+import atexit
+import logging
+import logging.handlers
+import math
+import hashlib
+import heapq
+import random
+from dataclasses import dataclass
+from functools import lru_cache
 import argparse
+import subprocess
 from pathlib import Path
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Optional
 import tempfile
 import shutil
 import time
+import threading
+import queue
+import io
+from concurrent.futures import ThreadPoolExecutor, Future
+import httpx
 from dotenv import load_dotenv
-from openai import OpenAI
-from pydub import AudioSegment
-from pydub.utils import make_chunks
+from openai import OpenAI, APIStatusError, APIConnectionError, RateLimitError, InternalServerError
 try:
     from tqdm import tqdm
 except ImportError:
     # Fallback if tqdm is not available
     def tqdm(iterable, *args, **kwargs):
         return iterable
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+try:
+    from platformdirs import user_cache_dir
+except ImportError:
+    # Fallback to the XDG default if platformdirs is not available
+    def user_cache_dir(appname):
+        return os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), appname)
 
 load_dotenv()
 
+class _TqdmStreamHandler(logging.StreamHandler):
+    """Writes log lines through tqdm.write so they don't tear an active progress bar"""
+    def emit(self, record):
+        if not hasattr(tqdm, "write"):
+            return super().emit(record)
+        try:
+            tqdm.write(self.format(record), file=self.stream)
+        except Exception:
+            self.handleError(record)
+
+# Worker threads only enqueue records; a single listener thread does the terminal writes
+logger = logging.getLogger("transcriber")
+logger.setLevel(logging.INFO)
+logger.propagate = False
+_log_queue = queue.Queue(-1)
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+_console_handler = _TqdmStreamHandler(sys.stdout)
+_console_handler.setFormatter(logging.Formatter("%(message)s"))
+_log_listener = logging.handlers.QueueListener(_log_queue, _console_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)  # Flush queued lines on exit
+
+# Transient failures worth retrying: 429, 5xx, and connection errors/timeouts (APITimeoutError included)
+RETRYABLE_ERRORS = (RateLimitError, InternalServerError, APIConnectionError)
+MAX_RETRY_DELAY = 30  # Seconds; upper bound for both backoff and Retry-After
+
+# Marks the end of the chunker thread's output
+_CHUNKING_DONE = object()
+
+@dataclass
+class FileInfo:
+    """Size and chunking plan for one audio file, gathered once and passed through the pipeline"""
+    path: Path
+    size_mb: float
+    needs_chunking: bool = False
+    duration_ms: float = 0.0
+    bit_rate: int = 0  # bps, 0 if unknown
+    chunk_length_ms: int = 0
+    chunk_count: int = 1
+
+@lru_cache(maxsize=4096)
+def _ffprobe_format(path_str: str, mtime_ns: int) -> Tuple[float, int]:
+    """Read duration (ms) and bit rate (bps, 0 if unknown) from the container header via ffprobe
+    
+    mtime_ns is part of the cache key so an edited file is probed again.
+    """
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration,bit_rate",
+         "-of", "default=nw=1", path_str],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe failed on {Path(path_str).name}: {result.stderr.strip()}")
+    fields = dict(line.split("=", 1) for line in result.stdout.splitlines() if "=" in line)
+    duration_ms = float(fields["duration"]) * 1000
+    try:
+        bit_rate = int(fields.get("bit_rate", ""))
+    except ValueError:
+        bit_rate = 0  # ffprobe reports "N/A" for some containers
+    return duration_ms, bit_rate
+
+# Chunk directories are reused across runs (the web app transcribes once per request).
+# Set CHUNK_TMPFS_DIR (e.g. /dev/shm) to keep chunk writes in memory; this is opt-in because
+# tmpfs pages count against the container's memory limit and survive a SIGKILL of this process.
+MAX_POOLED_CHUNK_DIRS = 8
+_chunk_dir_pool = queue.Queue(maxsize=MAX_POOLED_CHUNK_DIRS)
+
+def _chunk_dir_parent():
+    """CHUNK_TMPFS_DIR when it is set to an existing directory, otherwise the system temp dir"""
+    tmpfs_dir = os.getenv("CHUNK_TMPFS_DIR")
+    if tmpfs_dir and os.path.isdir(tmpfs_dir):
+        return tmpfs_dir
+    return None
+
+def acquire_chunk_dir() -> Path:
+    """Take an empty chunk directory from the pool, creating one if the pool is empty"""
+    while True:
+        try:
+            directory = _chunk_dir_pool.get_nowait()
+        except queue.Empty:
+            return Path(tempfile.mkdtemp(prefix="audio_chunks_", dir=_chunk_dir_parent()))
+        if directory.is_dir():
+            return directory
+
+def _remove_dir_in_background(directory: Path):
+    """Rename a directory out of the way and delete it on a background thread
+    
+    The thread is non-daemon so the CLI still finishes the cleanup before exiting,
+    but only after results have been produced.
+    """
+    trash = directory.with_name(directory.name + ".trash")
+    try:
+        directory.rename(trash)
+    except OSError:
+        trash = directory
+    threading.Thread(target=shutil.rmtree, args=(trash,), kwargs={"ignore_errors": True},
+                     name="temp-cleanup").start()
+
+def release_chunk_dir(directory: Path):
+    """Empty a chunk directory and return it to the pool, or delete it if the pool is full"""
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                else:
+                    os.unlink(entry.path)
+        _chunk_dir_pool.put_nowait(directory)
+    except (OSError, queue.Full):
+        _remove_dir_in_background(directory)
+
+def _drain_chunk_dir_pool():
+    """Delete pooled directories at exit so nothing is left behind in the temp dir"""
+    while True:
+        try:
+            shutil.rmtree(_chunk_dir_pool.get_nowait(), ignore_errors=True)
+        except queue.Empty:
+            return
+
+atexit.register(_drain_chunk_dir_pool)
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+def get_http_client() -> httpx.Client:
+    """Process-wide HTTP client so every transcriber reuses the same keep-alive (HTTP/2 when available) connections"""
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                http2=HTTP2_AVAILABLE,
+                limits=httpx.Limits(max_keepalive_connections=16, max_connections=32),
+                timeout=httpx.Timeout(300.0, connect=10.0),
+            )
+        return _http_client
+
+class TranscriptCache:
+    """Disk cache of generated text keyed by the SHA-256 of its input plus the settings that produced it
+    
+    Chunk transcripts live in the "transcripts" namespace (keyed by audio bytes) and
+    summary shards in "summaries" (keyed by transcript text).
+    """
+    
+    def __init__(self, cache_dir: Path = None, max_bytes: int = 2 * 1024 ** 3, namespace: str = "transcripts"):
+        self.cache_dir = Path(cache_dir or user_cache_dir("audio-transcriber")) / namespace
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+    
+    def _finish_key(self, digest, settings: Dict) -> str:
+        for name in sorted(settings):
+            digest.update(f"\0{name}={settings[name]}".encode("utf-8"))
+        return digest.hexdigest()
+    
+    def key_for(self, file_path: Path, **settings) -> str:
+        """Hash the audio bytes and the settings that affect the transcript"""
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return self._finish_key(digest, settings)
+    
+    def key_for_text(self, text: str, **settings) -> str:
+        """Hash a piece of text and the settings that affect what is generated from it"""
+        return self._finish_key(hashlib.sha256(text.encode("utf-8")), settings)
+    
+    def get(self, key: str):
+        """Return the cached transcript, or None on a miss"""
+        path = self.cache_dir / f"{key}.txt"
+        try:
+            text = path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return None
+        # Mark the hit explicitly: relatime/noatime mounts wouldn't, and evict() orders by atime
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return text
+    
+    def put(self, key: str, transcript: str):
+        """Store a transcript atomically so concurrent readers never see a partial file
+        
+        A failed write (e.g. full or read-only disk) only loses the cache entry, never the transcript.
+        """
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        except OSError as e:
+            logger.warning(f"⚠️  Could not write cache entry: {str(e)}")
+            return
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(transcript)
+            os.replace(tmp_path, self.cache_dir / f"{key}.txt")
+        except OSError as e:
+            os.unlink(tmp_path)
+            logger.warning(f"⚠️  Could not write cache entry: {str(e)}")
+    
+    def evict(self):
+        """Delete least recently used entries until the cache fits its byte budget"""
+        entries = []
+        total = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".txt"):
+                    st = entry.stat()
+                    entries.append((st.st_atime, st.st_size, entry.path))
+                    total += st.st_size
+        if total <= self.max_bytes:
+            return
+        heapq.heapify(entries)
+        while entries and total > self.max_bytes:
+            _, size, path = heapq.heappop(entries)
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+class RollingSummarizer:
+    """Summarizes transcripts incrementally in the background while later chunks are still transcribing
+    
+    Chunk transcripts are offered as each chunk finishes (in any order) and folded in chunk order.
+    Once the unsummarized text reaches `budget_tokens`, it is split into shards of at most that
+    size and each shard is folded into the previous summary, so no prompt grows with the transcript.
+    Updates run on a single worker so each one builds on the last.
+    """
+    
+    def __init__(self, update_fn, count_tokens, split_text, budget_tokens: int):
+        self.update_fn = update_fn  # (previous_summary, new_text) -> updated summary
+        self.count_tokens = count_tokens
+        self.split_text = split_text  # text -> shards of at most budget_tokens
+        self.budget_tokens = budget_tokens
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._lock = threading.Lock()
+        self._summary_future = None
+        self._futures = []  # every submitted update, so cancel() can drop the queued ones
+        self._cancelled = False
+        self._next_index = 0
+        self._finished_early = {}  # chunk index -> transcript, for chunks that finished out of order
+        self._pending: List[str] = []
+        self._pending_tokens = 0
+    
+    def offer(self, index: int, transcript: str):
+        """Record chunk `index`'s transcript ("" if none) and start an update once enough text is in order"""
+        with self._lock:
+            if self._cancelled:
+                return
+            self._finished_early[index] = transcript
+            while self._next_index in self._finished_early:
+                text = self._finished_early.pop(self._next_index)
+                self._next_index += 1
+                if text:
+                    self._pending.append(text)
+                    self._pending_tokens += self.count_tokens(text)
+            if self._pending_tokens >= self.budget_tokens:
+                self._flush(keep_remainder=True)
+    
+    def _flush(self, keep_remainder: bool = False):
+        """Submit the pending text as budget-sized shards, optionally holding back a partial last shard"""
+        shards = self.split_text(" ".join(self._pending))
+        remainder = shards.pop() if keep_remainder and len(shards) > 1 else None
+        for shard in shards:
+            self._submit(shard)
+        self._pending = [remainder] if remainder else []
+        self._pending_tokens = self.count_tokens(remainder) if remainder else 0
+    
+    def _submit(self, new_text: str):
+        previous = self._summary_future
+        self._summary_future = self._executor.submit(
+            lambda: self.update_fn(previous.result() if previous else "", new_text))
+        self._futures.append(self._summary_future)
+    
+    def finish(self) -> str:
+        """Fold in the remaining transcripts and return the final summary"""
+        try:
+            with self._lock:
+                if self._pending:
+                    self._flush()
+                summary_future = self._summary_future
+            return summary_future.result() if summary_future else ""
+        finally:
+            self._executor.shutdown(wait=False)
+    
+    def cancel(self):
+        """Drop queued updates, e.g. when processing is aborted"""
+        with self._lock:
+            self._cancelled = True
+            # Only an update already running can't be cancelled; everything queued behind it is dropped
+            for future in self._futures:
+                future.cancel()
+        self._executor.shutdown(wait=False)
+
 class AudioTranscriber:
+    # Sequence file name pattern, formatted with the escaped prefix
+    _SEQ_TEMPLATE = r"{prefix}_(\d+)\.m4a$"
+    
     def __init__(self, api_key: str = None, test_mode: bool = False, model: str = "gpt-4o-mini-transcribe", 
-                 response_format: str = "text", prompt: str = ""):
-        self.client = OpenAI(api_key=api_key or os.getenv('OPENAI_API_KEY'))
+                 response_format: str = "text", prompt: str = "", max_workers: int = 4, max_retries: int = 5,
+                 use_cache: bool = True):
+        # Retries are handled in _with_retries so they are not multiplied by the client's own
+        self.client = OpenAI(api_key=api_key or os.getenv('OPENAI_API_KEY'), max_retries=0,
+                             http_client=get_http_client())
         if not self.client.api_key:
             raise ValueError("OpenAI API key not found. Please set OPENAI_API_KEY in .env file")
         
-        self.max_file_size_mb = 10  # OpenAI Whisper limit
-        self.chunk_length_ms = 10 * 60 * 1000  # 10 minutes in milliseconds
+        self.max_file_size_mb = 24  # OpenAI Whisper limit is 25MB, keep a safety margin
+        # Longest chunk sent in one request: gpt-4o transcribe models reject audio over ~1500s.
+        # Also the chunk length when the bit rate is unknown.
+        self.chunk_length_ms = 10 * 60 * 1000
         self.test_mode = test_mode
         self.test_duration_ms = 60 * 1000  # 1 minute for test mode
         self.model = model
         self.response_format = response_format
         self.prompt = prompt
+        self.max_workers = max(1, max_workers)  # Concurrent Whisper requests
+        self.max_retries = max_retries
+        self._progress_lock = threading.Lock()
+        self.cache = self._open_cache("transcripts") if use_cache else None
+        self.summary_cache = self._open_cache("summaries") if use_cache else None
+        self.summary_model = "gpt-4o-mini"
+        self.summary_shard_tokens = 3000  # Upper bound on transcript text per summary prompt
+        self.summary_workers = 8
+        self.silence_threshold_db = -50.0  # Chunks quieter than this on average...
+        self.silence_max_volume_db = -40.0  # ...with no peak above this are not sent to the API
+        self._rolling_summary = None  # (language, transcript, summary) from the last run
         
+    def _open_cache(self, namespace: str) -> Optional[TranscriptCache]:
+        """Open a disk cache, running without one if the cache directory can't be created"""
+        try:
+            return TranscriptCache(namespace=namespace)
+        except OSError as e:
+            logger.warning(f"⚠️  Cache disabled ({namespace}): {str(e)}")
+            return None
+    
     def find_sequential_files(self, directory: str, pattern_prefix: str) -> List[Path]:
         """Find and sort sequential audio files based on naming pattern"""
         directory = Path(directory)
         files = []
         
         # Pattern to match files like xx_1.m4a, xx_2.m4a, etc.
-        pattern = re.compile(rf"{re.escape(pattern_prefix)}_(\d+)\.m4a$", re.IGNORECASE)
+        pattern = re.compile(self._SEQ_TEMPLATE.format(prefix=re.escape(pattern_prefix)), re.IGNORECASE)
         
-        for file_path in directory.glob("*.m4a"):
-            match = pattern.match(file_path.name)
-            if match:
-                sequence_num = int(match.group(1))
-                files.append((sequence_num, file_path))
+        # scandir reads names straight from the directory without a stat per entry
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                name = entry.name
+                if not name.lower().endswith(".m4a"):
+                    continue
+                match = pattern.match(name)
+                if match:
+                    sequence_num = int(match.group(1))
+                    files.append((sequence_num, directory / name))
         
         # Sort by sequence number
         files.sort(key=lambda x: x[0])
@@ -62,64 +415,137 @@ class AudioTranscriber:
         """Get file size in MB"""
         return file_path.stat().st_size / (1024 * 1024)
     
-    def get_chunk_count(self, file_path: Path) -> int:
-        """Get the number of chunks a file will be split into"""
+    def _chunk_length_for_bit_rate(self, bit_rate: int) -> int:
+        """Longest chunk duration that stays under both the upload size limit and the duration limit"""
+        if not bit_rate:
+            return self.chunk_length_ms
+        # 5% headroom for container overhead and bit rate variation
+        limit_bits = self.max_file_size_mb * 8 * 1024 * 1024
+        return max(1000, min(int(limit_bits / bit_rate * 1000 * 0.95), self.chunk_length_ms))
+    
+    def get_file_info(self, file_path: Path) -> FileInfo:
+        """Stat and probe the file to plan its chunks; the audio is never decoded"""
+        stat = file_path.stat()
+        info = FileInfo(path=file_path, size_mb=stat.st_size / (1024 * 1024))
         if self.test_mode:
-            return 1
+            return info
         
-        file_size_mb = self.get_file_size_mb(file_path)
-        if file_size_mb <= self.max_file_size_mb:
-            return 1
+        # Low bit rate files can be small yet too long for the transcription models
+        info.duration_ms, info.bit_rate = _ffprobe_format(str(file_path), stat.st_mtime_ns)
+        if info.size_mb <= self.max_file_size_mb and info.duration_ms <= self.chunk_length_ms:
+            return info
         
-        # Load audio to calculate actual chunks needed
-        audio = AudioSegment.from_file(str(file_path))
-        chunks = make_chunks(audio, self.chunk_length_ms)
-        return len(chunks)
+        info.needs_chunking = True
+        info.chunk_length_ms = self._chunk_length_for_bit_rate(info.bit_rate)
+        info.chunk_count = max(1, math.ceil(info.duration_ms / info.chunk_length_ms))
+        return info
+    
+    def _run_ffmpeg(self, args: List[str]) -> subprocess.CompletedProcess:
+        """Run ffmpeg non-interactively, raising RuntimeError with its stderr on failure"""
+        result = subprocess.run(["ffmpeg", "-nostdin", "-loglevel", "error", "-y", *args],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed: {result.stderr.strip()}")
+        return result
+    
+    def _volume_db(self, file_path: Path) -> Optional[Tuple[float, float]]:
+        """(mean, max) volume in dB from ffmpeg's volumedetect filter, or None if it can't be measured"""
+        # volumedetect reports at info level, so this can't go through _run_ffmpeg
+        result = subprocess.run(["ffmpeg", "-nostdin", "-hide_banner", "-nostats", "-i", str(file_path),
+                                 "-af", "volumedetect", "-f", "null", "-"],
+                                capture_output=True, text=True)
+        mean_match = re.search(r"mean_volume:\s*(-?[\d.]+|-inf)\s*dB", result.stderr)
+        max_match = re.search(r"max_volume:\s*(-?[\d.]+|-inf)\s*dB", result.stderr)
+        if result.returncode != 0 or not mean_match or not max_match:
+            return None
+        return float(mean_match.group(1)), float(max_match.group(1))
+    
+    def is_silent(self, file_path: Path) -> bool:
+        """Whether a chunk is silent enough that transcribing it would only cost time (and invite hallucinations)"""
+        # The peak check keeps a short utterance in an otherwise quiet chunk from being dropped
+        volume = self._volume_db(file_path)
+        if volume is None:
+            return False
+        mean_volume, max_volume = volume
+        return mean_volume < self.silence_threshold_db and max_volume < self.silence_max_volume_db
+    
+    def get_chunk_count(self, file_path: Path) -> int:
+        """Get the number of chunks a file will be split into"""
+        return self.get_file_info(file_path).chunk_count
     
-    def chunk_audio_file(self, file_path: Path, temp_dir: Path) -> List[Path]:
+    def chunk_audio_file(self, file_path: Path, temp_dir: Path, info: FileInfo = None) -> List[Path]:
         """Chunk audio file if it's too large for OpenAI API or for test mode"""
-        # Load audio file first to check duration and handle test mode
-        print(f"Loading audio file: {file_path.name}...")
-        audio = AudioSegment.from_file(str(file_path))
-        
         # Test mode: only process first 1 minute
         if self.test_mode:
-            print(f"🧪 TEST MODE: Processing only first 1 minute of {file_path.name}")
-            audio = audio[:self.test_duration_ms]
-            test_filename = f"{file_path.stem}_test_1min.mp4"
+            logger.info(f"🧪 TEST MODE: Processing only first 1 minute of {file_path.name}")
+            test_filename = f"{file_path.stem}_test_1min.m4a"
             test_path = temp_dir / test_filename
-            audio.export(str(test_path), format="mp4")
+            # ffmpeg stops reading after the first minute of packets, so the file is never fully loaded
+            trim_args = ["-ss", "0", "-t", str(self.test_duration_ms // 1000), "-i", str(file_path)]
+            try:
+                self._run_ffmpeg(trim_args + ["-c", "copy", str(test_path)])
+            except RuntimeError:
+                # Source codec can't be stream-copied into m4a (e.g. wav/mp3), so re-encode the minute
+                self._run_ffmpeg(trim_args + ["-c:a", "aac", "-b:a", "96k", str(test_path)])
             return [test_path]
         
-        file_size_mb = self.get_file_size_mb(file_path)
-        
-        if file_size_mb <= self.max_file_size_mb:
+        info = info or self.get_file_info(file_path)
+        if not info.needs_chunking:
             return [file_path]
         
-        print(f"File {file_path.name} ({file_size_mb:.1f}MB) exceeds limit. Chunking...")
+        logger.info(f"File {file_path.name} ({info.size_mb:.1f}MB, {info.duration_ms / 60000:.1f} min) exceeds limit. Chunking...")
         
-        # Create chunks
-        chunks = make_chunks(audio, self.chunk_length_ms)
-        chunk_files = []
-        
-        print(f"Creating {len(chunks)} chunks...")
-        for i, chunk in enumerate(tqdm(chunks, desc="Creating chunks")):
-            chunk_filename = f"{file_path.stem}_chunk_{i+1:03d}.mp4"
-            chunk_path = temp_dir / chunk_filename
-            chunk.export(str(chunk_path), format="mp4")
-            chunk_files.append(chunk_path)
+        # Split with ffmpeg's segment muxer using stream copy: no decode, no re-encode.
+        # faststart puts the moov atom first so each chunk uploads as a self-describing m4a.
+        chunk_pattern = f"{file_path.stem}_chunk_*.m4a"
+        segment_args = [
+            "-i", str(file_path),
+            "-f", "segment",
+            "-segment_time", f"{info.chunk_length_ms / 1000:.3f}",
+            "-segment_format_options", "movflags=+faststart",
+            "-reset_timestamps", "1",
+        ]
+        output = str(temp_dir / f"{file_path.stem}_chunk_%03d.m4a")
+        try:
+            self._run_ffmpeg(segment_args + ["-c", "copy", output])
+        except RuntimeError:
+            # Source codec can't be stream-copied into m4a (e.g. wav/mp3), so re-encode to AAC
+            logger.info(f"Stream copy not possible for {file_path.name}, re-encoding chunks to AAC...")
+            for partial in temp_dir.glob(chunk_pattern):
+                partial.unlink()
+            self._run_ffmpeg(segment_args + ["-c:a", "aac", "-b:a", "96k", output])
+        chunk_files = sorted(temp_dir.glob(chunk_pattern))
         
+        logger.info(f"Created {len(chunk_files)} chunks")
         return chunk_files
     
     def transcribe_audio(self, file_path: Path, language: str = "th", current_chunk: int = None, total_chunks: int = None) -> str:
         """Transcribe a single audio file using OpenAI Whisper"""
         try:
             if current_chunk and total_chunks:
-                print(f"  🎤 [{current_chunk}/{total_chunks}] Transcribing: {file_path.name}...")
+                logger.info(f"  🎤 [{current_chunk}/{total_chunks}] Transcribing: {file_path.name}...")
             else:
-                print(f"  🎤 Transcribing: {file_path.name}...")
+                logger.info(f"  🎤 Transcribing: {file_path.name}...")
             start_time = time.time()
             
+            # Only plain-text formats are cached; json formats return response objects
+            cache_key = None
+            if self.cache and self.response_format not in ["json", "verbose_json"]:
+                cache_key = self.cache.key_for(file_path, model=self.model, language=language,
+                                               response_format=self.response_format, prompt=self.prompt,
+                                               test_mode=self.test_mode)
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    logger.info(f"  ⚡ Cache hit for {file_path.name}")
+                    return cached
+            
+            if self.is_silent(file_path):
+                logger.warning(f"  🔇 Skipping silent chunk: {file_path.name}")
+                if cache_key:
+                    self.cache.put(cache_key, "")
+                return ""
+            
+            # Pass the open file (not its bytes) so the multipart body is streamed from disk
             with open(file_path, "rb") as audio_file:
                 # Build transcription parameters
                 transcribe_params = {
@@ -137,107 +563,360 @@ class AudioTranscriber:
                 if self.response_format == "verbose_json":
                     transcribe_params["timestamp_granularities"] = ["word"]
                 
-                transcript = self.client.audio.transcriptions.create(**transcribe_params)
+                transcript = self._create_transcription(transcribe_params)
             
             elapsed_time = time.time() - start_time
-            print(f"  ✅ Completed in {elapsed_time:.1f}s")
+            logger.info(f"  ✅ Completed in {elapsed_time:.1f}s")
             
             # Handle different response formats
             if self.response_format in ["json", "verbose_json"]:
                 return transcript  # Already a dict/object
             else:
-                return transcript.strip() if hasattr(transcript, 'strip') else transcript
+                transcript = transcript.strip() if hasattr(transcript, 'strip') else transcript
+                if cache_key and isinstance(transcript, str):
+                    self.cache.put(cache_key, transcript)
+                return transcript
         except Exception as e:
-            print(f"  ❌ Error transcribing {file_path.name}: {str(e)}")
+            logger.error(f"  ❌ Error transcribing {file_path.name}: {str(e)}")
             return f"[ERROR: Could not transcribe {file_path.name}]"
     
-    def process_sequential_files(self, files: List[Path], language: str = "th") -> str:
-        """Process sequential audio files and return combined transcript"""
-        all_transcripts = []
-        temp_dir = Path(tempfile.mkdtemp(prefix="audio_chunks_"))
+    def _with_retries(self, call, label: str, before_retry=None):
+        """Run an API call, retrying transient errors with jittered exponential backoff
         
+        Shared by transcription and chat calls, since the client itself is created with max_retries=0.
+        before_retry, if given, runs before each new attempt (e.g. to rewind an upload).
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                return call()
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._retry_delay(e, attempt)
+                reason = f"HTTP {e.status_code}" if isinstance(e, APIStatusError) else type(e).__name__
+                logger.warning(f"  ⏳ {label}: {reason}, retry {attempt + 1}/{self.max_retries} in {delay:.1f}s...")
+                time.sleep(delay)
+                if before_retry:
+                    before_retry()
+    
+    def _create_transcription(self, transcribe_params: Dict):
+        """Call the transcription API with retries"""
+        audio_file = transcribe_params["file"]
+        return self._with_retries(lambda: self.client.audio.transcriptions.create(**transcribe_params),
+                                  audio_file.name, before_retry=lambda: audio_file.seek(0))
+    
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        """Seconds to wait before the next attempt, honouring the Retry-After header when present"""
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                # Capped like the backoff so a large header can't park a worker (and a web request)
+                return min(max(0.0, float(retry_after)), MAX_RETRY_DELAY)
+            except ValueError:
+                pass
+        # Jitter spreads out retries from concurrent workers that failed together
+        return min(2 ** attempt, MAX_RETRY_DELAY) + random.uniform(0, 1)
+    
+    def submit_chunks(self, executor: ThreadPoolExecutor, chunk_files: List[Path], language: str,
+                      chunk_offset: int, total_chunks: int, progress, chunk_dir: Path = None,
+                      on_transcribed=None) -> List[Future]:
+        """Queue chunks for concurrent transcription, returning futures in chunk order
+        
+        Chunks inside chunk_dir are deleted as soon as they are transcribed, keeping disk use low during the run.
+        on_transcribed(global_chunk_index, transcript) is called from the worker as each chunk finishes.
+        """
+        def submit_chunk(idx: int, chunk_file: Path) -> str:
+            transcript = self.transcribe_audio(chunk_file, language, chunk_offset + idx + 1, total_chunks)
+            # Never delete a source file that didn't need chunking
+            if chunk_dir is not None and chunk_file.parent == chunk_dir \
+                    and not (isinstance(transcript, str) and transcript.startswith("[ERROR")):
+                try:
+                    chunk_file.unlink()
+                except FileNotFoundError:
+                    pass
+            if on_transcribed:
+                on_transcribed(chunk_offset + idx, transcript)
+            with self._progress_lock:
+                progress.update(1)
+            return transcript
+        
+        return [executor.submit(submit_chunk, idx, chunk_file) for idx, chunk_file in enumerate(chunk_files)]
+    
+    def _chunk_files_worker(self, file_infos: List[FileInfo], held_dirs: set, chunk_queue: queue.Queue,
+                            stop_event: threading.Event):
+        """Producer: chunk each file into its own pooled directory and hand the chunks to the consumer"""
         try:
-            print(f"\n📁 Processing {len(files)} file(s)...")
+            for i, info in enumerate(file_infos, 1):
+                if stop_event.is_set():
+                    return
+                file_path = info.path
+                logger.info(f"\n📄 [{i}/{len(file_infos)}] Processing: {file_path.name}")
+                chunk_dir = acquire_chunk_dir()
+                held_dirs.add(chunk_dir)
+                chunk_files = self.chunk_audio_file(file_path, chunk_dir, info)
+                chunk_queue.put((i, file_path, chunk_dir, chunk_files))
+            chunk_queue.put(_CHUNKING_DONE)
+        except Exception as e:
+            chunk_queue.put(e)
+    
+    def process_sequential_files(self, files: List[Path], language: str = "th", summary_language: str = None) -> str:
+        """Process sequential audio files and return combined transcript
+        
+        A chunker thread segments file N+1 while the worker pool transcribes file N,
+        overlapping ffmpeg/disk work with network latency. If summary_language is given,
+        a rolling summary is built as files finish, and generate_summary reuses it.
+        """
+        # Transcripts are written straight into one buffer instead of being joined per file and again overall
+        output = io.StringIO()
+        held_dirs = set()  # Pooled chunk directories not yet released
+        # Holds at most one chunked file waiting for the consumer, bounding disk use
+        chunk_queue = queue.Queue(maxsize=1)
+        stop_event = threading.Event()
+        chunker = None
+        self._rolling_summary = None
+        summarizer = None
+        # JSON formats return response objects, which can't be folded into a text summary
+        if summary_language and self.response_format not in ["json", "verbose_json"]:
+            summarizer = RollingSummarizer(
+                lambda previous, new_text: self._update_summary(previous, new_text, summary_language),
+                count_tokens=self._token_counter(),
+                split_text=lambda text: self.split_transcript(text, self.summary_shard_tokens),
+                budget_tokens=self.summary_shard_tokens)
+        
+        def offer_to_summarizer(index, transcript):
+            # Failed chunks still advance the summarizer's in-order position
+            valid = isinstance(transcript, str) and not transcript.startswith("[ERROR")
+            summarizer.offer(index, transcript if valid else "")
+        
+        def finish_file(job):
+            i, file_path, chunk_dir, futures = job
+            file_transcripts = [t for t in (f.result() for f in futures) if t and not t.startswith("[ERROR")]
+            # Chunks are no longer needed once every one of them has been transcribed
+            held_dirs.discard(chunk_dir)
+            release_chunk_dir(chunk_dir)
+            
+            if file_transcripts:
+                prefix = "🧪 TEST " if self.test_mode else ""
+                if output.tell():
+                    output.write("\n\n")
+                output.write(f"=== {prefix}File {i}: {file_path.name} ===\n")
+                for j, transcript in enumerate(file_transcripts):
+                    if j:
+                        output.write(" ")
+                    output.write(transcript)
+                logger.info(f"✅ File {i} completed successfully")
+            else:
+                logger.warning(f"⚠️  No valid transcript generated for file {i}")
+        
+        try:
+            logger.info(f"\n📁 Processing {len(files)} file(s)...")
             
             # Calculate total chunks for overall progress
-            print("📊 Calculating total chunks...")
-            total_chunks = sum(self.get_chunk_count(file_path) for file_path in files)
-            print(f"📈 Total chunks to process: {total_chunks}")
+            logger.info("📊 Calculating total chunks...")
+            # Each file is stat'ed and probed once here; the chunker reuses these results
+            file_infos = [self.get_file_info(file_path) for file_path in files]
+            total_chunks = sum(info.chunk_count for info in file_infos)
+            logger.info(f"📈 Total chunks to process: {total_chunks}")
             
             # Create overall progress bar
             overall_progress = tqdm(total=total_chunks, desc="Overall Progress", unit="chunk")
             current_chunk = 0
             
-            for i, file_path in enumerate(files, 1):
-                print(f"\n📄 [{i}/{len(files)}] Processing: {file_path.name}")
-                
-                # Chunk file if needed
-                chunk_files = self.chunk_audio_file(file_path, temp_dir)
-                
-                file_transcripts = []
-                print(f"🔄 File {i}: Transcribing {len(chunk_files)} chunk(s)...")
-                
-                for j, chunk_file in enumerate(chunk_files, 1):
-                    current_chunk += 1
-                    overall_progress.set_description(f"File {i}/{len(files)} - Chunk {j}/{len(chunk_files)} ({current_chunk}/{total_chunks})")
+            chunker = threading.Thread(target=self._chunk_files_worker,
+                                       args=(file_infos, held_dirs, chunk_queue, stop_event), daemon=True)
+            chunker.start()
+            
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                pending_job = None
+                while True:
+                    item = chunk_queue.get()
+                    if item is _CHUNKING_DONE:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
                     
-                    transcript = self.transcribe_audio(chunk_file, language, current_chunk, total_chunks)
-                    if transcript and not transcript.startswith("[ERROR"):
-                        file_transcripts.append(transcript)
+                    i, file_path, chunk_dir, chunk_files = item
+                    logger.info(f"🔄 File {i}: Transcribing {len(chunk_files)} chunk(s) with up to {self.max_workers} worker(s)...")
+                    overall_progress.set_description(f"File {i}/{len(files)}")
                     
-                    overall_progress.update(1)
+                    futures = self.submit_chunks(executor, chunk_files, language,
+                                                 current_chunk, total_chunks, overall_progress, chunk_dir,
+                                                 on_transcribed=offer_to_summarizer if summarizer else None)
+                    current_chunk += len(chunk_files)
+                    
+                    # File N's chunks are queued behind file N-1's, so finishing N-1 keeps the pool busy
+                    if pending_job:
+                        finish_file(pending_job)
+                    pending_job = (i, file_path, chunk_dir, futures)
                 
-                if file_transcripts:
-                    combined_transcript = " ".join(file_transcripts)
-                    prefix = "🧪 TEST " if self.test_mode else ""
-                    all_transcripts.append(f"=== {prefix}File {i}: {file_path.name} ===\n{combined_transcript}")
-                    print(f"✅ File {i} completed successfully")
-                else:
-                    print(f"⚠️  No valid transcript generated for file {i}")
+                if pending_job:
+                    finish_file(pending_job)
             
             overall_progress.close()
+            
+            if summarizer:
+                try:
+                    rolling_summary = summarizer.finish()
+                    if rolling_summary:
+                        self._rolling_summary = (summary_language, output.getvalue(), rolling_summary)
+                except Exception as e:
+                    # generate_summary falls back to summarizing the full transcript
+                    logger.warning(f"⚠️  Rolling summary failed: {str(e)}")
+                summarizer = None
                 
         finally:
-            # Clean up temporary directory
-            print(f"\n🧹 Cleaning up temporary files...")
-            shutil.rmtree(temp_dir, ignore_errors=True)
+            if summarizer:
+                summarizer.cancel()
+
+            # Stop the chunker (unblocking it if it is waiting on the queue) before removing its output
+            stop_event.set()
+            if chunker is not None:
+                while chunker.is_alive():
+                    try:
+                        chunk_queue.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
+            
+            # Return directories of files that never finished (e.g. after an error) to the pool
+            logger.info(f"\n🧹 Cleaning up temporary files...")
+            for chunk_dir in list(held_dirs):
+                release_chunk_dir(chunk_dir)
+            if self.cache:
+                self.cache.evict()
+        
+        return output.getvalue()
+    
+    def _summary_system_prompt(self, language: str) -> str:
+        test_note = "Note: This summary is based on a 1-minute test sample." if self.test_mode else ""
+        return f"You are a helpful assistant that creates concise summaries. Please summarize the following transcript in {language}. Focus on key points, main topics discussed, and important conclusions. {test_note}"
+    
+    def _update_summary(self, previous_summary: str, new_text: str, language: str) -> str:
+        """Fold the next part of the transcript into the summary so far"""
+        if previous_summary:
+            user_content = (f"Here is the summary of the transcript so far:\n\n{previous_summary}\n\n"
+                            f"Update it to also cover this continuation of the transcript:\n\n{new_text}")
+        else:
+            user_content = f"Please summarize this transcript:\n\n{new_text}"
         
-        return "\n\n".join(all_transcripts)
+        return self._chat_summary(user_content, language)
+    
+    def _chat_summary(self, user_content: str, language: str) -> str:
+        response = self._with_retries(lambda: self.client.chat.completions.create(
+            model=self.summary_model,
+            messages=[
+                {"role": "system", "content": self._summary_system_prompt(language)},
+                {"role": "user", "content": user_content}
+            ],
+            max_tokens=1000,
+            temperature=0.3
+        ), "summary")
+        return response.choices[0].message.content.strip()
+    
+    def _token_counter(self):
+        """Return a function counting tokens for the summary model (approximate without tiktoken)"""
+        if tiktoken is None:
+            # Roughly two characters per token for Thai, which over-counts English and stays safe
+            return lambda text: len(text) // 2 + 1
+        try:
+            encoding = tiktoken.encoding_for_model(self.summary_model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("o200k_base")
+        return lambda text: len(encoding.encode(text))
+    
+    def split_transcript(self, transcript: str, max_tokens: int) -> List[str]:
+        """Split a transcript into shards of at most max_tokens, preferring sentence and line breaks"""
+        count_tokens = self._token_counter()
+        
+        # Sentence/line pieces first; pieces that are still too long fall back to word, then character, splits
+        pieces = []
+        for sentence in re.split(r"(?<=[.!?])\s+|\n+", transcript):
+            if count_tokens(sentence) <= max_tokens:
+                pieces.append(sentence)
+                continue
+            for word in sentence.split(" "):
+                if count_tokens(word) <= max_tokens:
+                    pieces.append(word)
+                else:
+                    step = max(1, len(word) * max_tokens // count_tokens(word))
+                    pieces.extend(word[k:k + step] for k in range(0, len(word), step))
+        
+        shards = []
+        current = []
+        current_tokens = 0
+        for piece in pieces:
+            if not piece:
+                continue
+            piece_tokens = count_tokens(piece) + 1
+            if current and current_tokens + piece_tokens > max_tokens:
+                shards.append(" ".join(current))
+                current = []
+                current_tokens = 0
+            current.append(piece)
+            current_tokens += piece_tokens
+        if current:
+            shards.append(" ".join(current))
+        return shards
+    
+    def _summarize_shard(self, shard: str, index: int, total: int, language: str) -> str:
+        """Map step: summarize one shard, reusing a cached result for identical text"""
+        cache_key = None
+        if self.summary_cache:
+            cache_key = self.summary_cache.key_for_text(shard, model=self.summary_model, language=language,
+                                                        test_mode=self.test_mode, step="map")
+            cached = self.summary_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        summary = self._chat_summary(
+            f"This is part {index} of {total} of a longer transcript. Please summarize this part:\n\n{shard}",
+            language)
+        if cache_key:
+            self.summary_cache.put(cache_key, summary)
+        return summary
+    
+    def _map_reduce_summary(self, transcript: str, language: str) -> str:
+        """Summarize long transcripts as parallel shard summaries combined by one final call"""
+        shards = self.split_transcript(transcript, self.summary_shard_tokens)
+        if len(shards) <= 1:
+            return self._update_summary("", transcript, language)
+        
+        logger.info(f"🧩 Summarizing {len(shards)} transcript parts in parallel...")
+        with ThreadPoolExecutor(max_workers=self.summary_workers) as executor:
+            shard_summaries = list(executor.map(
+                lambda args: self._summarize_shard(args[1], args[0], len(shards), language),
+                enumerate(shards, 1)))
+        
+        combined = "\n\n".join(f"Part {i}:\n{summary}" for i, summary in enumerate(shard_summaries, 1))
+        return self._chat_summary(
+            f"These are summaries of consecutive parts of one transcript. "
+            f"Combine them into a single summary of the whole transcript:\n\n{combined}",
+            language)
     
     def generate_summary(self, transcript: str, language: str = "thai") -> str:
         """Generate summary using OpenAI GPT"""
         try:
-            print(f"🤖 Generating summary in {language}...")
-            start_time = time.time()
-            
-            test_note = "Note: This summary is based on a 1-minute test sample." if self.test_mode else ""
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": f"You are a helpful assistant that creates concise summaries. Please summarize the following transcript in {language}. Focus on key points, main topics discussed, and important conclusions. {test_note}"
-                    },
-                    {
-                        "role": "user",
-                        "content": f"Please summarize this transcript:\n\n{transcript}"
-                    }
-                ],
-                max_tokens=1000,
-                temperature=0.3
-            )
-            
-            elapsed_time = time.time() - start_time
-            print(f"✅ Summary generated in {elapsed_time:.1f}s")
+            # Reuse the summary built while this transcript was being transcribed
+            if self._rolling_summary and self._rolling_summary[0] == language and self._rolling_summary[1] == transcript:
+                logger.info(f"🤖 Using summary built during transcription ({language})")
+                summary = self._rolling_summary[2]
+            else:
+                logger.info(f"🤖 Generating summary in {language}...")
+                start_time = time.time()
+                
+                summary = self._map_reduce_summary(transcript, language)
+                if self.summary_cache:
+                    self.summary_cache.evict()
+                
+                elapsed_time = time.time() - start_time
+                logger.info(f"✅ Summary generated in {elapsed_time:.1f}s")
             
-            summary = response.choices[0].message.content.strip()
             if self.test_mode:
                 summary = f"🧪 TEST MODE SUMMARY (1 minute sample)\n\n{summary}"
             
             return summary
         except Exception as e:
-            print(f"❌ Error generating summary: {str(e)}")
+            logger.error(f"❌ Error generating summary: {str(e)}")
             return "[ERROR: Could not generate summary]"
     
     def save_outputs(self, transcript: str, summary: str, output_dir: Path, prefix: str):
@@ -251,13 +930,13 @@ class AudioTranscriber:
         transcript_file = output_dir / f"{file_prefix}_transcript.txt"
         with open(transcript_file, 'w', encoding='utf-8') as f:
             f.write(transcript)
-        print(f"\n💾 Transcript saved to: {transcript_file}")
+        logger.info(f"\n💾 Transcript saved to: {transcript_file}")
         
         # Save summary
         summary_file = output_dir / f"{file_prefix}_summary.txt"
         with open(summary_file, 'w', encoding='utf-8') as f:
             f.write(summary)
-        print(f"💾 Summary saved to: {summary_file}")
+        logger.info(f"💾 Summary saved to: {summary_file}")
 
 def main():
     parser = argparse.ArgumentParser(description="Transcribe sequential audio files with auto-chunking")
@@ -267,36 +946,38 @@ def main():
     parser.add_argument("--output", "-o", default="output", help="Output directory (default: output)")
     parser.add_argument("--summary-lang", default="thai", help="Language for summary (default: thai)")
     parser.add_argument("--test", action="store_true", help="Test mode: process only first 1 minute of each audio file")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the API instead of reusing cached chunk transcripts")
+    parser.add_argument("--workers", "-w", type=int, default=4, help="Number of chunks to transcribe concurrently (default: 4)")
     
     args = parser.parse_args()
     
     try:
-        transcriber = AudioTranscriber(test_mode=args.test)
+        transcriber = AudioTranscriber(test_mode=args.test, max_workers=args.workers, use_cache=not args.no_cache)
         
         if args.test:
-            print("🧪 RUNNING IN TEST MODE - Processing only first 1 minute of each file")
+            logger.info("🧪 RUNNING IN TEST MODE - Processing only first 1 minute of each file")
         
         # Find sequential files
         files = transcriber.find_sequential_files(args.directory, args.prefix)
         if not files:
-            print(f"No sequential files found with prefix '{args.prefix}' in directory '{args.directory}'")
+            logger.warning(f"No sequential files found with prefix '{args.prefix}' in directory '{args.directory}'")
             return
         
-        print(f"\n📋 Found {len(files)} sequential files:")
+        logger.info(f"\n📋 Found {len(files)} sequential files:")
         for i, file_path in enumerate(files, 1):
             size_mb = transcriber.get_file_size_mb(file_path)
             test_note = " (will process 1min only)" if args.test else ""
-            print(f"  {i}. {file_path.name} ({size_mb:.1f}MB){test_note}")
+            logger.info(f"  {i}. {file_path.name} ({size_mb:.1f}MB){test_note}")
         
         # Process files
-        transcript = transcriber.process_sequential_files(files, args.language)
+        transcript = transcriber.process_sequential_files(files, args.language, summary_language=args.summary_lang)
         
         if not transcript:
-            print("No transcript generated. Please check your audio files.")
+            logger.warning("No transcript generated. Please check your audio files.")
             return
         
         # Generate summary
-        print("\n📝 Generating summary...")
+        logger.info("\n📝 Generating summary...")
         summary = transcriber.generate_summary(transcript, args.summary_lang)
         
         # Save outputs
@@ -304,10 +985,10 @@ def main():
         transcriber.save_outputs(transcript, summary, output_dir, args.prefix)
         
         test_note = " (TEST MODE)" if args.test else ""
-        print(f"\n🎉 Processing complete{test_note}! Files saved in '{output_dir}' directory.")
+        logger.info(f"\n🎉 Processing complete{test_note}! Files saved in '{output_dir}' directory.")
         
     except Exception as e:
-        print(f"Error: {str(e)}")
+        logger.error(f"Error: {str(e)}")
         return 1
 
 if __name__ == "__main__":
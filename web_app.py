@@ -5,13 +5,18 @@ Mobile-friendly interface for audio transcription using OpenAI Whisper
 """
 
 import os
+import io
 import tempfile
+import shutil
 import zipfile
 import threading
+import atexit
 import time
+import mimetypes
 from pathlib import Path
-from flask import Flask, request, render_template, redirect, url_for, flash, send_file, jsonify, session
+from flask import Flask, request, render_template, redirect, url_for, flash, send_file, jsonify, session, Response, stream_with_context
 from werkzeug.utils import secure_filename
+from werkzeug.middleware.proxy_fix import ProxyFix
 import uuid
 from functools import wraps
 from audio_transcriber import AudioTranscriber
@@ -22,6 +27,15 @@ app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'your-secret-key-change-this
 # Security settings
 APP_PASSCODE = os.environ.get('APP_PASSCODE', 'transcribe2024')  # Change in production!
 SESSION_TIMEOUT = 3600  # 1 hour in seconds
+LOGIN_ATTEMPT_WINDOW = 900  # Failed logins are counted over 15 minutes
+MAX_LOGIN_ATTEMPTS = 5
+MAX_TRACKED_CLIENTS = 10000  # Bounds memory used by the login attempt table
+# Number of reverse proxies in front of the app. Only then is X-Forwarded-For trusted, and only
+# the hops those proxies appended; 0 uses the socket address. Defaults to 1 on Railway, whose edge
+# proxy would otherwise put every client in one login attempt bucket.
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', 1 if os.environ.get('RAILWAY_ENVIRONMENT') else 0))
+if TRUSTED_PROXY_HOPS > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
 MAX_CONTENT_LENGTH = 150 * 1024 * 1024  # 150MB max upload
 
 # Security headers
@@ -44,6 +58,10 @@ UPLOAD_FOLDER = 'uploads'
 RESULTS_FOLDER = 'results'
 ALLOWED_EXTENSIONS = {'m4a', 'mp3', 'wav', 'mp4'}
 MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB
+# When served behind nginx, set to an internal location aliased to RESULTS_FOLDER, e.g.
+#   location /_protected_results/ { internal; alias /app/results/; }
+# so downloads are handed to nginx via X-Accel-Redirect instead of streamed through Python.
+ACCEL_REDIRECT_PREFIX = os.environ.get('ACCEL_REDIRECT_PREFIX', '').rstrip('/')
 
 # Set max content length for Flask
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
@@ -56,61 +74,66 @@ os.makedirs(RESULTS_FOLDER, exist_ok=True)
 RESULT_RETENTION_HOURS = 24  # Keep results for 24 hours
 CLEANUP_INTERVAL_MINUTES = 60  # Run cleanup every hour
 
+def _walk_files(root):
+    """Yield every non-directory entry under root (os.scandir caches each entry's type)"""
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk_files(entry.path)
+            else:
+                yield entry
+
 def cleanup_old_files():
-    """Remove old upload and result files"""
+    """Remove old upload and result files in a single pass, stat-ing each entry once"""
     try:
-        current_time = time.time()
-        retention_seconds = RESULT_RETENTION_HOURS * 3600
+        cutoff = time.time() - RESULT_RETENTION_HOURS * 3600
         
-        # Clean uploads folder
-        uploads_path = Path(UPLOAD_FOLDER)
-        if uploads_path.exists():
-            for session_dir in uploads_path.iterdir():
-                if session_dir.is_dir():
-                    # Check if session folder is old
-                    dir_age = current_time - session_dir.stat().st_mtime
-                    if dir_age > retention_seconds:
-                        import shutil
-                        shutil.rmtree(session_dir, ignore_errors=True)
-                        print(f"🧹 Cleaned up old upload session: {session_dir.name}")
-        
-        # Clean results folder
-        results_path = Path(RESULTS_FOLDER)
-        if results_path.exists():
-            for session_dir in results_path.iterdir():
-                if session_dir.is_dir():
-                    # Check if session folder is old
-                    dir_age = current_time - session_dir.stat().st_mtime
-                    if dir_age > retention_seconds:
-                        import shutil
-                        shutil.rmtree(session_dir, ignore_errors=True)
-                        print(f"🧹 Cleaned up old result session: {session_dir.name}")
-                        
-        # Also clean individual old files
-        for folder in [uploads_path, results_path]:
-            if folder.exists():
-                for file_path in folder.rglob('*'):
-                    if file_path.is_file():
-                        file_age = current_time - file_path.stat().st_mtime
-                        if file_age > retention_seconds:
-                            file_path.unlink(missing_ok=True)
+        for folder, label in [(UPLOAD_FOLDER, 'upload'), (RESULTS_FOLDER, 'result')]:
+            if not os.path.isdir(folder):
+                continue
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    # Files can vanish mid-pass (process_audio or another worker removing them);
+                    # skip those instead of abandoning the rest of the pass
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                        if entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                            # Whole session folder (or stray file) is old
+                            if is_dir:
+                                shutil.rmtree(entry.path, ignore_errors=True)
+                                print(f"🧹 Cleaned up old {label} session: {entry.name}")
+                            else:
+                                os.unlink(entry.path)
+                        elif is_dir:
+                            # Recent session folder: only drop individual old files
+                            for file_entry in _walk_files(entry.path):
+                                try:
+                                    if file_entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                                        os.unlink(file_entry.path)
+                                except FileNotFoundError:
+                                    pass
+                    except FileNotFoundError:
+                        pass
                             
     except Exception as e:
         print(f"🔧 Cleanup error (non-critical): {e}")
 
+_cleanup_stop = threading.Event()
+
 def start_cleanup_scheduler():
     """Start background cleanup scheduler"""
     def cleanup_loop():
-        while True:
-            time.sleep(CLEANUP_INTERVAL_MINUTES * 60)  # Convert to seconds
+        # Event.wait returns early when shutdown is requested instead of sleeping out the interval
+        while not _cleanup_stop.wait(CLEANUP_INTERVAL_MINUTES * 60):
             cleanup_old_files()
     
     # Run initial cleanup
     cleanup_old_files()
     
     # Start background thread
-    cleanup_thread = threading.Thread(target=cleanup_loop, daemon=True)
+    cleanup_thread = threading.Thread(target=cleanup_loop, name="cleanup-scheduler", daemon=True)
     cleanup_thread.start()
+    atexit.register(_cleanup_stop.set)
     print(f"🧹 Started auto-cleanup: keeping files for {RESULT_RETENTION_HOURS}h, checking every {CLEANUP_INTERVAL_MINUTES}m")
 
 # Start cleanup scheduler when app starts
@@ -119,8 +142,52 @@ start_cleanup_scheduler()
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def get_file_size_mb(file_path):
-    return os.path.getsize(file_path) / (1024 * 1024)
+def save_upload(file, dest_path):
+    """Stream an upload to disk in one pass, counting bytes as they are written
+    
+    Returns the size in bytes, or None (and removes the partial file) once it exceeds MAX_FILE_SIZE.
+    """
+    written = 0
+    with open(dest_path, 'wb') as out:
+        while True:
+            block = file.stream.read(1024 * 1024)
+            if not block:
+                break
+            written += len(block)
+            if written > MAX_FILE_SIZE:
+                break
+            out.write(block)
+    if written > MAX_FILE_SIZE:
+        os.remove(dest_path)
+        return None
+    return written
+
+class ZipStreamSink(io.RawIOBase):
+    """Write-only, unseekable sink that collects zipfile output so it can be yielded in pieces"""
+    def __init__(self):
+        self._chunks = []
+    
+    def writable(self):
+        return True
+    
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+    
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def stream_zip(file_paths):
+    """Yield a DEFLATE-compressed ZIP of file_paths piece by piece, without writing it to disk"""
+    sink = ZipStreamSink()
+    # zipfile falls back to data descriptors when the target can't seek, so entries stream out in order
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=6) as zipf:
+        for file_path in file_paths:
+            zipf.write(file_path, file_path.name)
+            yield sink.drain()
+    yield sink.drain()
 
 def login_required(f):
     """Decorator to require login for protected routes"""
@@ -152,41 +219,56 @@ def validate_file_security(file):
     if not allowed_file(filename):
         return False, f"File type not allowed. Allowed: {', '.join(ALLOWED_EXTENSIONS)}"
     
-    # Check file size (additional check)
-    file.seek(0, 2)  # Seek to end
-    size = file.tell()
-    file.seek(0)  # Reset to beginning
-    
-    if size > MAX_FILE_SIZE:
+    # Fast path on the client-advertised size; the real size is enforced while saving (see save_upload)
+    if file.content_length and file.content_length > MAX_FILE_SIZE:
         return False, f"File too large. Maximum size: {MAX_FILE_SIZE // (1024*1024)}MB"
     
-    if size < 1024:  # Less than 1KB is suspicious
-        return False, "File too small to be a valid audio file"
-    
     return True, filename
 
 @app.route('/login')
 def login():
     return render_template('login.html')
 
+# Failed login timestamps per client IP, kept server-side so clearing cookies doesn't reset the limit
+_login_attempts = {}
+_login_attempts_lock = threading.Lock()
+
+def get_client_ip():
+    """Client IP; X-Forwarded-For is resolved by ProxyFix only when TRUSTED_PROXY_HOPS is set"""
+    return request.remote_addr or 'unknown'
+
+def recent_login_attempts(client_ip, current_time):
+    """Number of failed logins from client_ip inside the attempt window"""
+    with _login_attempts_lock:
+        attempts = [t for t in _login_attempts.get(client_ip, []) if current_time - t < LOGIN_ATTEMPT_WINDOW]
+        if attempts:
+            _login_attempts[client_ip] = attempts
+        else:
+            _login_attempts.pop(client_ip, None)
+        return len(attempts)
+
+def record_failed_login(client_ip, current_time):
+    with _login_attempts_lock:
+        if client_ip not in _login_attempts and len(_login_attempts) >= MAX_TRACKED_CLIENTS:
+            # Drop expired clients first, then the oldest tracked ones
+            for ip in [ip for ip, times in _login_attempts.items() if current_time - times[-1] >= LOGIN_ATTEMPT_WINDOW]:
+                del _login_attempts[ip]
+            while len(_login_attempts) >= MAX_TRACKED_CLIENTS:
+                del _login_attempts[next(iter(_login_attempts))]
+        _login_attempts.setdefault(client_ip, []).append(current_time)
+
+def clear_login_attempts(client_ip):
+    with _login_attempts_lock:
+        _login_attempts.pop(client_ip, None)
+
 @app.route('/login', methods=['POST'])
 def login_post():
-    import time
-    
     # Rate limiting (simple implementation)
-    client_ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.environ.get('REMOTE_ADDR', 'unknown'))
+    client_ip = get_client_ip()
     current_time = time.time()
     
-    # Check for brute force attempts (store in session for simplicity)
-    attempts_key = f'login_attempts_{client_ip}'
-    if attempts_key not in session:
-        session[attempts_key] = []
-    
-    # Clean old attempts (older than 15 minutes)
-    session[attempts_key] = [t for t in session[attempts_key] if current_time - t < 900]
-    
     # Check if too many attempts
-    if len(session[attempts_key]) >= 5:
+    if recent_login_attempts(client_ip, current_time) >= MAX_LOGIN_ATTEMPTS:
         flash('Too many login attempts. Please wait 15 minutes before trying again.', 'error')
         return redirect(url_for('login'))
     
@@ -200,14 +282,12 @@ def login_post():
         session['login_time'] = current_time
         session.permanent = True
         # Clear failed attempts on successful login
-        if attempts_key in session:
-            del session[attempts_key]
+        clear_login_attempts(client_ip)
         flash('Access granted! Welcome to Audio Transcriber.', 'success')
         return redirect(url_for('index'))
     else:
         # Record failed attempt
-        session[attempts_key].append(current_time)
-        session.modified = True
+        record_failed_login(client_ip, current_time)
         flash('Invalid passcode. Please try again.', 'error')
         return redirect(url_for('login'))
 
@@ -259,12 +339,15 @@ def upload_files():
             
             filename = result
             file_path = session_folder / filename
-            file.save(str(file_path))
+            size = save_upload(file, file_path)
             
-            # Double-check file size after saving
-            if get_file_size_mb(file_path) > 100:
+            if size is None:
+                flash(f'File {filename} is too large (max {MAX_FILE_SIZE // (1024*1024)}MB)', 'error')
+                return redirect(url_for('index'))
+            
+            if size < 1024:  # Less than 1KB is suspicious
                 os.remove(file_path)  # Clean up
-                flash(f'File {filename} is too large (max 100MB)', 'error')
+                flash(f'File validation failed: {filename} is too small to be a valid audio file', 'error')
                 return redirect(url_for('index'))
             
             uploaded_files.append(file_path)
@@ -313,8 +396,10 @@ def process_audio(session_id):
             return redirect(url_for('index'))
         
         # Initialize transcriber
+        # No disk cache: it would keep transcripts beyond RESULT_RETENTION_HOURS
         transcriber = AudioTranscriber(test_mode=test_mode, model=model, 
-                                     response_format=response_format, prompt=prompt)
+                                     response_format=response_format, prompt=prompt,
+                                     use_cache=False)
         
         # Create results directory for this session
         results_dir = Path(RESULTS_FOLDER) / session_id
@@ -325,7 +410,7 @@ def process_audio(session_id):
         file_paths.sort(key=lambda x: x.name)  # Sort by filename
         
         # Process the files
-        transcript = transcriber.process_sequential_files(file_paths, language)
+        transcript = transcriber.process_sequential_files(file_paths, language, summary_language=summary_lang)
         
         if not transcript:
             flash('No transcript generated. Please check your audio files.', 'error')
@@ -378,9 +463,20 @@ def process_audio(session_id):
 @login_required
 def download_file(session_id, filename):
     try:
+        # Reject path components like '..' before building paths or redirect headers
+        if secure_filename(session_id) != session_id or secure_filename(filename) != filename:
+            flash('File not found', 'error')
+            return redirect(url_for('index'))
+        
         file_path = Path(RESULTS_FOLDER) / session_id / filename
         if file_path.exists():
-            return send_file(str(file_path), as_attachment=True)
+            if ACCEL_REDIRECT_PREFIX:
+                # nginx sends the file itself (sendfile, zero-copy); the body here stays empty
+                response = app.response_class(status=200, mimetype=mimetypes.guess_type(filename)[0] or 'text/plain')
+                response.headers['X-Accel-Redirect'] = f'{ACCEL_REDIRECT_PREFIX}/{session_id}/{filename}'
+                response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+                return response
+            return send_file(str(file_path.resolve()), as_attachment=True)
         else:
             flash('File not found', 'error')
             return redirect(url_for('index'))
@@ -392,18 +488,21 @@ def download_file(session_id, filename):
 @login_required
 def download_all(session_id):
     try:
-        results_dir = Path(RESULTS_FOLDER) / session_id
-        if not results_dir.exists():
+        # Reject path components like '..' so only a session's own results folder can be zipped
+        if secure_filename(session_id) != session_id:
             flash('Results not found', 'error')
             return redirect(url_for('index'))
         
-        # Create zip file
-        zip_path = Path(RESULTS_FOLDER) / f"{session_id}_results.zip"
-        with zipfile.ZipFile(zip_path, 'w') as zipf:
-            for file_path in results_dir.glob('*.txt'):
-                zipf.write(file_path, file_path.name)
+        results_dir = (Path(RESULTS_FOLDER) / session_id).resolve()
+        if results_dir.parent != Path(RESULTS_FOLDER).resolve() or not results_dir.is_dir():
+            flash('Results not found', 'error')
+            return redirect(url_for('index'))
         
-        return send_file(str(zip_path), as_attachment=True, download_name=f"transcription_results.zip")
+        # Stream the zip straight to the client (includes .srt/.vtt/.json transcripts)
+        file_paths = sorted(p for p in results_dir.iterdir() if p.is_file())
+        return Response(stream_with_context(stream_zip(file_paths)),
+                        mimetype='application/zip',
+                        headers={'Content-Disposition': 'attachment; filename=transcription_results.zip'})
         
     except Exception as e:
         flash(f'Error creating download: {str(e)}', 'error')